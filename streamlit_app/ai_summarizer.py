@@ -1,13 +1,84 @@
 import os
+import json
 import time
+import hashlib
+import logging
+import random
+import re
 import ssl
+import threading
+import httpx
 import urllib3
+import tiktoken
+import diskcache
+from functools import lru_cache
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from openai import OpenAI
-from openai import RateLimitError, OpenAIError
+from openai import RateLimitError, OpenAIError, APITimeoutError, APIConnectionError, InternalServerError
 
 # Disable SSL warnings for debugging (not recommended for production)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+log = logging.getLogger(__name__)
+
+# Number of files summarized concurrently (the calls are I/O-bound on HTTP latency)
+MAX_CONCURRENT_REQUESTS = 8
+
+# Keep-alive sockets for the concurrent workers, with headroom for retries
+HTTP_LIMITS = httpx.Limits(
+    max_keepalive_connections=MAX_CONCURRENT_REQUESTS * 2,
+    max_connections=MAX_CONCURRENT_REQUESTS * 4
+)
+
+# Retry settings for transient API errors (rate limits, timeouts, network blips, 5xx)
+MAX_RETRIES = 5
+MAX_BACKOFF_SECONDS = 60
+RETRYABLE_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+# Summarization model and completion budget per summary
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MAX_TOKENS = 200  # Reduced from 250 to save tokens
+# Fixed instructions live in the system prompt so each user message carries only the file
+SYSTEM_PROMPT = (
+    "You are an expert technical writer. Summarize the markdown file you are given "
+    "in 3-5 concise sentences. If images are listed, mention them in the summary."
+)
+BATCH_SYSTEM_PROMPT = (
+    "You are an expert technical writer. Summarize each markdown file you are given "
+    "in 3-5 concise sentences. If a file lists images, mention them in its summary. "
+    "Respond with a JSON object mapping each file path exactly as given to its summary."
+)
+
+# Markdown content beyond this many tokens is truncated; the start of a file is enough to summarize it
+MAX_INPUT_TOKENS = 2000
+# Generous chars-per-token bound used to slice huge files before tokenizing them
+PRESLICE_CHARS_PER_TOKEN = 6
+# Used for the character-based cut when the tokenizer can't be loaded
+CHARS_PER_TOKEN_ESTIMATE = 4
+
+# Model summaries persist on disk across runs and deployments, keyed by
+# (model, PROMPT_VERSION, content). Bump PROMPT_VERSION whenever the prompts change.
+SUMMARY_CACHE_DIR = os.getenv("SUMMARY_CACHE_DIR", os.path.join(".cache", "summaries"))
+PROMPT_VERSION = 1
+
+# Small files are summarized several per request to amortize per-request overhead
+FILES_PER_REQUEST = 5
+MAX_BATCH_INPUT_TOKENS = 6000
+
+IMAGES_NOTE = "\n\nNote: This section includes images/diagrams for improved understanding."
+
+# Boilerplate files get a canned summary instead of an API call
+TRIVIAL_FILE_RE = re.compile(r"(?i)^(LICENSE|CHANGELOG|CODEOWNERS|CONTRIBUTING)")
+TRIVIAL_FILE_DESCRIPTIONS = {
+    "license": "License terms under which this repository is distributed.",
+    "changelog": "Changelog recording the changes made in each release.",
+    "codeowners": "Code owners file listing who reviews changes to each part of the repository.",
+    "contributing": "Contribution guidelines describing how to propose changes to this repository.",
+}
+# Files with less content than this are stubs, not worth summarizing
+MIN_SUMMARY_CHARS = 100
+
 def get_openai_client():
     """Get OpenAI client with API key from environment"""
     api_key = os.getenv("OPENAI_API_KEY")
@@ -16,97 +87,517 @@ def get_openai_client():
     
     # Try with default settings first
     try:
-        return OpenAI(api_key=api_key)
+        return OpenAI(
+            api_key=api_key,
+            http_client=httpx.Client(timeout=30.0, limits=HTTP_LIMITS)
+        )
     except Exception as e:
-        print(f"Standard client failed: {e}")
+        log.warning("Standard client failed: %s", e)
         # Try with custom HTTP client for SSL issues
-        import httpx
         custom_client = httpx.Client(
             verify=False,  # Disable SSL verification as workaround
-            timeout=30.0
+            timeout=30.0,
+            limits=HTTP_LIMITS
         )
         return OpenAI(api_key=api_key, http_client=custom_client)
 
 
-def summarize_markdown_files(client, markdown_files, image_files=None):
+class OpenAIThrottle:
     """
-    Summarizes markdown files and mentions related images
+    Client-side token buckets for requests/minute and tokens/minute, so calls
+    are paced under the account limits instead of bouncing off 429s.
+    Thread-safe; refills lazily from the elapsed time on each acquire.
     """
-    summaries = {}
-    
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Limits from OPENAI_RPM / OPENAI_TPM, defaulting to Tier 1"""
+        return cls(
+            requests_per_minute=int(os.getenv("OPENAI_RPM", "3500")),
+            tokens_per_minute=int(os.getenv("OPENAI_TPM", "90000"))
+        )
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, est_tokens=0):
+        """Block until one request and est_tokens tokens are available, then take them"""
+        # A single request larger than the whole bucket would otherwise wait forever
+        est_tokens = min(est_tokens, self.tokens_per_minute)
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= est_tokens:
+                    self._requests -= 1
+                    self._tokens -= est_tokens
+                    return
+                wait_time = max(
+                    (1 - self._requests) * 60 / self.requests_per_minute,
+                    (est_tokens - self._tokens) * 60 / self.tokens_per_minute
+                )
+            time.sleep(wait_time)
+
+
+# Shared across calls (and Streamlit reruns) since the limits are per account
+_throttle = OpenAIThrottle.from_env()
+
+
+def _retry_delay(error, retry_count):
+    """
+    Seconds to wait before the next attempt: the server's Retry-After when
+    it sends one, otherwise exponential backoff with jitter
+    """
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(MAX_BACKOFF_SECONDS, float(retry_after))
+            except ValueError:
+                pass  # HTTP-date form, fall back to backoff
+    return min(MAX_BACKOFF_SECONDS, 1.0 * (2 ** retry_count)) + random.uniform(0, 0.5)
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model):
+    """
+    Tokenizer for model, falling back to cl100k_base for unknown models.
+    None if it can't be loaded: tiktoken downloads the encoding on first use,
+    which fails offline or behind a TLS-intercepting proxy (a pre-seeded
+    TIKTOKEN_CACHE_DIR avoids the download).
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        log.warning("Could not load the tokenizer (%s), truncating by characters instead", e)
+        return None
+
+
+def _truncate_to_tokens(content, model, max_tokens=MAX_INPUT_TOKENS):
+    """Returns (content cut to at most max_tokens tokens, its token count, whether it was cut)"""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        # Approximate both the cut and the count from the length
+        head = content[:max_tokens * CHARS_PER_TOKEN_ESTIMATE]
+        return head, -(-len(head) // CHARS_PER_TOKEN_ESTIMATE), len(head) < len(content)
+
+    # Only tokenize what could possibly fit, not megabytes of markdown
+    head = content[:max_tokens * PRESLICE_CHARS_PER_TOKEN]
+    tokens = encoding.encode(head, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return head, len(tokens), len(head) < len(content)
+    return encoding.decode(tokens[:max_tokens]), max_tokens, True
+
+
+def _prepare_content(path, content, model=SUMMARY_MODEL):
+    """
+    Truncates a file for the prompt; returns (prompt content, token count)
+    """
+    # TRUNCATE LARGE FILES - Keep the first MAX_INPUT_TOKENS tokens to stay under token limit
+    truncated_content, num_tokens, was_truncated = _truncate_to_tokens(content, model)
+    if was_truncated:
+        truncated_content += "\n\n[... Content truncated for brevity ...]"
+        log.info("⚠️ Truncated %s from %d to %d characters", path, len(content), len(truncated_content))
+    return truncated_content, num_tokens
+
+
+def _index_images_by_dir(image_files=None):
+    """Maps each directory to the images directly inside it, built once per run"""
+    images_by_dir = defaultdict(list)
+    for img in image_files or []:
+        images_by_dir[os.path.dirname(img)].append(img)
+    return images_by_dir
+
+
+def _related_images(path, images_by_dir):
+    """Images in the same directory as the markdown file at path"""
+    return images_by_dir.get(os.path.dirname(path), [])
+
+
+def _file_header(path, images_by_dir):
+    """Path line, plus the images in the file's directory when it has any"""
+    header = f"File: {path}"
+    related_images = _related_images(path, images_by_dir)
+    if related_images:
+        header += f"\nImages: {', '.join(related_images)}"
+    return header
+
+
+def _build_prompt(path, content, images_by_dir):
+    """Builds the user message for one (already truncated) file"""
+    return f"{_file_header(path, images_by_dir)}\n\n{content}"
+
+
+def _build_batch_prompt(entries, images_by_dir):
+    """Builds one user message holding several (path, truncated content) entries"""
+    return "\n\n".join(
+        f"=== {_file_header(path, images_by_dir)}\n\n{content}"
+        for path, content in entries
+    )
+
+
+def _chat_request(prompt, model, max_tokens=SUMMARY_MAX_TOKENS, system_prompt=SYSTEM_PROMPT):
+    """Keyword arguments for a chat completion request summarizing prompt"""
+    return {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        "temperature": 0.2,
+        "max_tokens": max_tokens
+    }
+
+
+def _reference_line(path):
+    """Closing line linking a summary back to its file"""
+    return f"For full details, refer to: [{os.path.basename(path)}]({path})"
+
+
+def _fallback_summary(path):
+    """Summary used when the model could not summarize a file"""
+    return f"Documentation file: {os.path.basename(path)}. {_reference_line(path)}"
+
+
+def _finalize_summary(path, summary_text, images_by_dir):
+    """
+    Adds the per-path parts to a model summary: the reference link, and a
+    note when the file's directory has images. Kept out of the model output
+    so one summary can be reused for every copy of an identical file.
+    """
+    summary_text += "\n\n" + _reference_line(path)
+
+    # Append custom note about images if they exist
+    if _related_images(path, images_by_dir):
+        summary_text += IMAGES_NOTE
+
+    return summary_text
+
+
+def _canned_summary(path, content):
+    """
+    Summary text for boilerplate or stub files, or None if the file needs
+    the model
+    """
+    match = TRIVIAL_FILE_RE.match(os.path.basename(path))
+    if match:
+        return TRIVIAL_FILE_DESCRIPTIONS[match.group(1).lower()]
+
+    stripped = " ".join(content.split())
+    if len(stripped) < MIN_SUMMARY_CHARS:
+        return f'Short file containing only: "{stripped}"' if stripped else "Empty documentation file."
+
+    return None
+
+
+@lru_cache(maxsize=None)
+def _get_summary_cache():
+    """On-disk summary cache, opened on first use"""
+    return diskcache.Cache(SUMMARY_CACHE_DIR)
+
+
+def _summary_cache_key(content, model):
+    """Cache key for the model summary of content"""
+    return hashlib.blake2b(f"{model}|{PROMPT_VERSION}|{content}".encode("utf-8")).hexdigest()
+
+
+def _group_identical(markdown_files):
+    """
+    Groups paths by file content so identical files (license boilerplate,
+    copied READMEs) are only sent to the model once; first path is the representative
+    """
+    groups = defaultdict(list)
     for path, content in markdown_files.items():
+        groups[hashlib.blake2b(content.encode("utf-8")).digest()].append(path)
+    return list(groups.values())
+
+
+def _plan_batches(prepared):
+    """
+    Splits {path: (content, token count)} into lists of paths to summarize
+    together: at most FILES_PER_REQUEST files and MAX_BATCH_INPUT_TOKENS tokens each
+    """
+    batches = []
+    current, current_tokens = [], 0
+    for path, (_, num_tokens) in prepared.items():
+        if current and (len(current) >= FILES_PER_REQUEST or current_tokens + num_tokens > MAX_BATCH_INPUT_TOKENS):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(path)
+        current_tokens += num_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _create_with_retry(client, request, label, throttle=None):
+    """
+    Rate-limit-safe chat completion call with retry; returns the response,
+    or None if the request kept failing
+    """
+    # This loop is the only retry layer; the SDK's own retries (429s, 5xx,
+    # timeouts) would multiply the attempts and stack a second backoff
+    client = client.with_options(max_retries=0)
+    retry_count = 0
+
+    while retry_count < MAX_RETRIES:
         try:
-            # Get the directory of this markdown file
-            file_dir = os.path.dirname(path)
-            
-            # Find images in the same directory
-            related_images = []
-            if image_files:
-                related_images = [img for img in image_files if img.startswith(file_dir)]
-            
-            # Check if this file has related images
-            has_images = len(related_images) > 0
-            
-            # TRUNCATE LARGE FILES - Keep first 3000 characters to stay under token limit
-            if len(content) > 3000:
-                truncated_content = content[:3000] + "\n\n[... Content truncated for brevity ...]"
-                print(f"⚠️ Truncated {path} from {len(content)} to {len(truncated_content)} characters")
+            if throttle:
+                # Rough estimate: ~4 characters per prompt token plus the completion budget
+                prompt_chars = sum(len(message["content"]) for message in request["messages"])
+                throttle.acquire(est_tokens=prompt_chars // 4 + request["max_tokens"])
+
+            return client.chat.completions.create(**request)
+
+        except RETRYABLE_ERRORS as e:
+            retry_count += 1
+            if retry_count < MAX_RETRIES:
+                wait_time = _retry_delay(e, retry_count)
+                log.warning("Rate limit or transient error: %s. Retrying in %.1f seconds...", e, wait_time)
+                time.sleep(wait_time)
+
+        except OpenAIError as e:
+            # Not retryable (bad request, auth, ...), don't waste attempts on it
+            log.error("OpenAI error for %s: %s", label, e)
+            break
+
+    return None
+
+
+def _summarize_one(client, path, content, images_by_dir, throttle=None, model=SUMMARY_MODEL):
+    """
+    Summarizes a single (already truncated) markdown file and returns
+    (path, model summary), or (path, None) if the model could not summarize it
+    """
+    prompt = _build_prompt(path, content, images_by_dir)
+    response = _create_with_retry(client, _chat_request(prompt, model), path, throttle)
+    if response is None:
+        log.warning("⚠️ Failed to summarize %s, using fallback summary", path)
+        return path, None
+    return path, response.choices[0].message.content.strip()
+
+
+def _summarize_batch(client, entries, images_by_dir, throttle=None, model=SUMMARY_MODEL):
+    """
+    Summarizes several (path, truncated content) entries in one JSON-mode
+    request and returns {path: model summary or None}. Files a response
+    arrived for but doesn't cover are retried one at a time; if the request
+    itself kept failing, every file is None (retrying each one alone would
+    only multiply the load during a rate limit or outage).
+    """
+    if len(entries) == 1:
+        path, content = entries[0]
+        return dict([_summarize_one(client, path, content, images_by_dir, throttle, model)])
+
+    request = _chat_request(
+        _build_batch_prompt(entries, images_by_dir),
+        model,
+        max_tokens=SUMMARY_MAX_TOKENS * len(entries),
+        system_prompt=BATCH_SYSTEM_PROMPT
+    )
+    request["response_format"] = {"type": "json_object"}
+
+    label = ", ".join(path for path, _ in entries)
+    response = _create_with_retry(client, request, label, throttle)
+    if response is None:
+        log.warning("⚠️ Failed to summarize %s, using fallback summaries", label)
+        return {path: None for path, _ in entries}
+
+    try:
+        parsed = json.loads(response.choices[0].message.content)
+    except (TypeError, ValueError):
+        log.warning("⚠️ Could not parse batched summaries for %s, summarizing one by one", label)
+        parsed = {}
+    if not isinstance(parsed, dict):
+        parsed = {}
+
+    results = {}
+    for path, content in entries:
+        summary_text = parsed.get(path)
+        if isinstance(summary_text, str) and summary_text.strip():
+            results[path] = summary_text.strip()
+        else:
+            results[path] = _summarize_one(client, path, content, images_by_dir, throttle, model)[1]
+    return results
+
+
+def summarize_markdown_files(client, markdown_files, image_files=None, max_workers=MAX_CONCURRENT_REQUESTS, throttle=None, model=SUMMARY_MODEL, on_progress=None, on_fallback=None):
+    """
+    Summarizes markdown files and mentions related images.
+    Small files are packed several per request; requests run concurrently,
+    at most max_workers in flight, paced by throttle (defaults to the shared
+    OPENAI_RPM/OPENAI_TPM limiter). on_progress(done, total) is called from
+    the calling thread as files finish, and on_fallback(path) for every file
+    that got a fallback or error summary instead of a model summary.
+    """
+    summaries = {}
+    throttle = throttle or _throttle
+    images_by_dir = _index_images_by_dir(image_files)
+
+    # Boilerplate and stub files don't need the model
+    to_summarize = {}
+    for path, content in markdown_files.items():
+        canned = _canned_summary(path, content)
+        if canned is None:
+            to_summarize[path] = content
+        else:
+            summaries[path] = _finalize_summary(path, canned, images_by_dir)
+
+    if on_progress:
+        on_progress(len(summaries), len(markdown_files))
+
+    # Identical files share one summary; key each group by its representative
+    groups = {paths[0]: paths for paths in _group_identical(to_summarize)}
+
+    def fan_out(representative, summary_text):
+        for path in groups[representative]:
+            if summary_text is None:
+                # If all retries fail, create a simple fallback summary
+                summaries[path] = _fallback_summary(path)
+                if on_fallback:
+                    on_fallback(path)
             else:
-                truncated_content = content
-            
-            # Enhanced prompt that includes image information
-            prompt = f"""
-Summarize the following markdown file in 3-5 concise sentences.
-
-File: {path}
-Directory: {file_dir}
-Related images in same directory: {related_images}
-
-If there are related images, mention them in the summary.
-End with: "For full details, refer to: [{os.path.basename(path)}]({path})"
-
-Markdown content:
-{truncated_content}
-"""
-
-            # Rate-limit-safe call with retry
-            max_retries = 2
-            retry_count = 0
-            
-            while retry_count < max_retries:
-                try:
-                    response = client.chat.completions.create(
-                        model="gpt-4",
-                        messages=[
-                            {"role": "system", "content": "You are an expert technical writer."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=0.2,
-                        max_tokens=200  # Reduced from 250 to save tokens
-                    )
-                    
-                    summary_text = response.choices[0].message.content.strip()
-                    
-                    # Append custom note about images if they exist
-                    if has_images:
-                        summary_text += "\n\nNote: This section includes images/diagrams for improved understanding."
-                    
-                    summaries[path] = summary_text
-                    break  # Success, exit retry loop
-                    
-                except Exception as e:
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        wait_time = 30  # Increased wait time
-                        print(f"Rate limit or other error: {e}. Retrying in {wait_time} seconds...")
-                        time.sleep(wait_time)
-                    else:
-                        # If all retries fail, create a simple fallback summary
-                        summaries[path] = f"Documentation file: {os.path.basename(path)}. For full details, refer to: [{os.path.basename(path)}]({path})"
-                        print(f"⚠️ Failed to summarize {path}, using fallback summary")
-                        break
-                        
-        except Exception as e:
-            summaries[path] = f"❌ Error summarizing {path}: {str(e)}"
-    
-    return summaries
\ No newline at end of file
+                summaries[path] = _finalize_summary(path, summary_text, images_by_dir)
+
+    # Files summarized before (by any run using the same model and prompts) come from disk
+    cache = _get_summary_cache()
+    cache_keys = {path: _summary_cache_key(markdown_files[path], model) for path in groups}
+    pending = []
+    for representative in groups:
+        cached = cache.get(cache_keys[representative])
+        if cached is None:
+            pending.append(representative)
+        else:
+            fan_out(representative, cached)
+
+    if on_progress:
+        on_progress(len(summaries), len(markdown_files))
+
+    prepared = {path: _prepare_content(path, markdown_files[path], model) for path in pending}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                _summarize_batch,
+                client,
+                [(path, prepared[path][0]) for path in batch],
+                images_by_dir,
+                throttle,
+                model
+            ): batch
+            for batch in _plan_batches(prepared)
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                results = {}
+                for representative in batch:
+                    for path in groups[representative]:
+                        summaries[path] = f"❌ Error summarizing {path}: {str(e)}"
+                        if on_fallback:
+                            on_fallback(path)
+
+            for representative, summary_text in results.items():
+                if summary_text is not None:
+                    cache.set(cache_keys[representative], summary_text)
+                fan_out(representative, summary_text)
+
+            if on_progress:
+                on_progress(len(summaries), len(markdown_files))
+
+    # Keep the original file order so the generated document is stable
+    return {path: summaries[path] for path in markdown_files}
+
+
+def submit_summary_batch(client, markdown_files, image_files=None, model=SUMMARY_MODEL):
+    """
+    Submits every summary request as one Batch API job and returns its id.
+    Batches are cheaper and not rate-limited per call, but take up to 24h,
+    so use this for non-interactive runs and collect with collect_summary_batch.
+    """
+    images_by_dir = _index_images_by_dir(image_files)
+    to_summarize = {
+        path: content for path, content in markdown_files.items()
+        if _canned_summary(path, content) is None
+    }
+    lines = []
+    for paths in _group_identical(to_summarize):
+        path = paths[0]
+        content, _ = _prepare_content(path, markdown_files[path], model)
+        prompt = _build_prompt(path, content, images_by_dir)
+        lines.append(json.dumps({
+            "custom_id": path,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": _chat_request(prompt, model)
+        }))
+
+    batch_file = client.files.create(
+        file=("summaries.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    )
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    return batch.id
+
+
+def collect_summary_batch(client, batch_id, markdown_files, image_files=None, poll_interval=30):
+    """
+    Waits for a batch from submit_summary_batch to finish and returns the
+    summaries in the same shape as summarize_markdown_files
+    """
+    batch = client.batches.retrieve(batch_id)
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch_id)
+
+    outputs = {}
+    if batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if response.get("status_code") == 200:
+                outputs[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"].strip()
+
+    images_by_dir = _index_images_by_dir(image_files)
+    summaries = {}
+    to_summarize = {}
+    for path, content in markdown_files.items():
+        canned = _canned_summary(path, content)
+        if canned is None:
+            to_summarize[path] = content
+        else:
+            summaries[path] = _finalize_summary(path, canned, images_by_dir)
+
+    for paths in _group_identical(to_summarize):
+        summary_text = outputs.get(paths[0])
+        for path in paths:
+            if summary_text is None:
+                log.warning("⚠️ Batch did not summarize %s, using fallback summary", path)
+                summaries[path] = _fallback_summary(path)
+            else:
+                summaries[path] = _finalize_summary(path, summary_text, images_by_dir)
+
+    # Keep the original file order so the generated document is stable
+    return {path: summaries[path] for path in markdown_files}
@@ -1,15 +1,22 @@
 import streamlit as st
 import streamlit.components.v1 as components  # Add this line
-from openai import OpenAI
+import io
+import logging
 import os
+import threading
+import time
 import requests  # Add this line
 from dotenv import load_dotenv
+
+# Load environment variables from .env file before importing the local modules,
+# which read their settings (SUMMARY_MODEL, OPENAI_RPM/TPM, cache dirs) at import
+load_dotenv()
+
 from repo_fetcher import fetch_repository_docs
-from ai_summarizer import summarize_markdown_files
+from ai_summarizer import get_openai_client, summarize_markdown_files, SUMMARY_MODEL
 from html_builder import generate_onboarding_html, save_html_file
 
-# Load environment variables from .env file
-load_dotenv()
+logging.basicConfig(level=logging.INFO)
 
 st.set_page_config(page_title="Onboarding PDF Generator", layout="wide")
 
@@ -45,6 +52,97 @@ if "html_error" not in st.session_state:
 if "pdf_content" not in st.session_state:
     st.session_state["pdf_content"] = None
 
+# The environment doesn't change between reruns, so check the API key once per session
+if "api_key_ok" not in st.session_state:
+    st.session_state["api_key_ok"] = bool(os.getenv("OPENAI_API_KEY"))
+    st.session_state["api_key_notice_shown"] = False
+
+
+# ---------------- CACHED HELPERS ----------------
+
+@st.cache_resource
+def get_client():
+    """OpenAI client shared across reruns so its connection pool stays warm"""
+    return get_openai_client()
+
+
+@st.cache_data(ttl=600, show_spinner="Fetching repository documentation and images...")
+def cached_fetch(repo_url: str, _refresh: bool = False) -> dict:
+    """
+    Fetch repository docs, cached for 10 minutes per repository URL
+    (_refresh is left out of the key; it also replaces the on-disk fetch cache entry)
+    """
+    return fetch_repository_docs(repo_url, refresh=_refresh)
+
+
+class IncompleteSummaries(Exception):
+    """
+    Raised by cached_summarize when some files only got fallback summaries,
+    so the run isn't cached (st.cache_data never stores a raised call) and
+    summarizing again retries them. Carries the summaries anyway.
+    """
+    def __init__(self, summaries, failed_paths):
+        super().__init__(f"{len(failed_paths)} files could not be summarized")
+        self.summaries = summaries
+        self.failed_paths = failed_paths
+
+
+@st.cache_data(show_spinner=False)
+def cached_summarize(markdown_files: dict, image_files: tuple, model: str, _on_progress=None) -> dict:
+    """
+    Summarize markdown files, cached in memory by file contents and model.
+    Persistence across restarts is the summarizer's per-file disk cache.
+    """
+    # model has no default on purpose: st.cache_data keys only on the arguments
+    # actually passed, so a defaulted model would not invalidate the cache.
+    # The OpenAI client is unhashable, so it is looked up here instead of passed in
+    # (likewise the leading underscore keeps the progress callback out of the cache key)
+    client = get_client()
+    failed_paths = []
+    summaries = summarize_markdown_files(
+        client,
+        markdown_files,
+        list(image_files),
+        model=model,
+        on_progress=_on_progress,
+        on_fallback=failed_paths.append
+    )
+    if failed_paths:
+        raise IncompleteSummaries(summaries, failed_paths)
+    return summaries
+
+
+# ---------------- PDF API ----------------
+
+PDF_API_URL = "http://localhost:5165/api/pdf/generate"
+
+
+def request_pdf(payload, result):
+    """
+    POST the HTML to the .NET PDF API and fill result with the status code and
+    either the PDF bytes or the error text. Runs on a worker thread, so it
+    must not touch st.* or session state; exceptions are handed back in result.
+    """
+    try:
+        with requests.post(
+            PDF_API_URL,
+            json=payload,
+            headers={"Content-Type": "application/json"},
+            timeout=120,
+            stream=True
+        ) as response:
+            result["status_code"] = response.status_code
+            if response.status_code == 200:
+                pdf_buffer = io.BytesIO()
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    pdf_buffer.write(chunk)
+                # Plain bytes: st.download_button copies a BytesIO on every rerun
+                result["pdf_bytes"] = pdf_buffer.getvalue()
+            else:
+                result["error_text"] = response.text
+    except Exception as e:
+        result["exception"] = e
+
 
 # ---------------- CALLBACKS ----------------
 
@@ -55,8 +153,10 @@ def do_fetch():
         return
         
     try:
-        with st.spinner("Fetching repository documentation and images..."):
-            result = fetch_repository_docs(st.session_state["repo_input"])
+        force_refresh = bool(st.session_state.get("force_refresh"))
+        if force_refresh:
+            cached_fetch.clear()
+        result = cached_fetch(st.session_state["repo_input"], _refresh=force_refresh)
             
         st.session_state["markdown_files"] = result["markdown_files"]
         st.session_state["image_files"] = result["image_files"]
@@ -91,16 +191,33 @@ def do_summarize():
         
     try:
         st.session_state["summary_error"] = None
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))       
-        with st.spinner("🤖 Generating AI summaries..."):
-            summaries = summarize_markdown_files(
-                client, 
-                st.session_state["markdown_files"],
-                st.session_state.get("image_files")  # Pass image files to summarizer
+        with st.status("🤖 Generating AI summaries...") as status:
+            def show_progress(done, total):
+                status.update(label=f"🤖 Generating AI summaries... {done}/{total} files")
+
+            try:
+                summaries = cached_summarize(
+                    st.session_state["markdown_files"],
+                    tuple(st.session_state.get("image_files") or ()),  # Tuple so it hashes as a cache key
+                    model=SUMMARY_MODEL,
+                    _on_progress=show_progress
+                )
+                failed_paths = []
+            except IncompleteSummaries as e:
+                summaries, failed_paths = e.summaries, e.failed_paths
+            status.update(
+                label=f"🤖 Summarized {len(summaries)} files",
+                state="error" if failed_paths else "complete"
             )
             
         st.session_state["summaries"] = summaries
-        st.success(f"✅ Generated summaries for {len(summaries)} files")
+        if failed_paths:
+            st.warning(
+                f"⚠️ {len(failed_paths)} of {len(summaries)} files got fallback summaries "
+                "(see the log). They were not cached; click Summarize again to retry them."
+            )
+        else:
+            st.success(f"✅ Generated summaries for {len(summaries)} files")
         
     except Exception as e:
         st.session_state["summaries"] = None
@@ -136,22 +253,31 @@ def do_generate_html():
             "FileName": f"{repo_name}_onboarding.pdf"
         }
         
-        with st.spinner("Generating PDF with IronPDF..."):
-            response = requests.post(
-                "http://localhost:5165/api/pdf/generate",
-                json=payload,
-                headers={"Content-Type": "application/json"},
-                timeout=120
+        # Run the request on a worker thread and report progress while it renders
+        result = {}
+        worker = threading.Thread(target=request_pdf, args=(payload, result), daemon=True)
+        started = time.monotonic()
+        worker.start()
+        with st.status("Generating PDF with IronPDF...") as status:
+            while worker.is_alive():
+                worker.join(timeout=0.5)
+                status.update(label=f"Generating PDF with IronPDF... {time.monotonic() - started:.0f}s")
+            status.update(
+                label=f"PDF request finished in {time.monotonic() - started:.1f}s",
+                state="complete" if "pdf_bytes" in result else "error"
             )
         
-        if response.status_code == 200:
-            # Store the binary PDF content
-            st.session_state["pdf_content"] = response.content
+        if "exception" in result:
+            raise result["exception"]
+        
+        if "pdf_bytes" in result:
+            pdf_bytes = result["pdf_bytes"]
+            st.session_state["pdf_content"] = pdf_bytes
             st.success("✅ PDF generated successfully using IronPDF!")
-            st.info(f"PDF size: {len(response.content):,} bytes")
+            st.info(f"PDF size: {len(pdf_bytes):,} bytes")
         else:
-            st.error(f"❌ PDF generation failed (Status: {response.status_code})")
-            st.error(f"Response: {response.text}")
+            st.error(f"❌ PDF generation failed (Status: {result['status_code']})")
+            st.error(f"Response: {result['error_text']}")
             
     except requests.exceptions.Timeout:
         st.error("❌ PDF generation timed out. The document may be too large.")
@@ -186,15 +312,21 @@ with col2:
         placeholder="Company or organization"
     )
 
-# Check if API key is loaded
-if not os.getenv("OPENAI_API_KEY"):
+# Check if API key is loaded (keep the error visible, confirm success only once)
+if not st.session_state["api_key_ok"]:
     st.error("⚠️ OpenAI API key not found. Please add OPENAI_API_KEY to your .env file")
-else:
+elif not st.session_state["api_key_notice_shown"]:
     st.success("✅ OpenAI API key loaded successfully")
+    st.session_state["api_key_notice_shown"] = True
 
 # ---------------- BUTTONS ----------------
 
 st.button("Fetch Documentation", on_click=do_fetch)
+st.checkbox(
+    "Force refresh",
+    key="force_refresh",
+    help="Ignore the cached copy and download the repository again"
+)
 
 st.button(
     "Summarize with AI",
@@ -225,49 +357,69 @@ if st.session_state.get("pdf_content"):
         mime="application/pdf"
     )
 
-# Main documentation expander
-with st.expander("📄 Fetched Documentation", expanded=False):
-    if st.session_state["fetch_error"]:
-        st.error(st.session_state["fetch_error"])
-    elif st.session_state["markdown_files"]:
-        num_files = len(st.session_state["markdown_files"])
-        num_images = len(st.session_state.get("image_files", []))  # Fixed this line
-        
-        st.info(f"📊 Found {num_files} markdown files and {num_images} images")
-        
-        # Show images if any
-        if num_images > 0:
-            st.subheader("🖼️ Images Found")
-            for img_path in st.session_state["image_files"]:
-                st.text(img_path)
-        
-        # Show markdown content
-        st.subheader("📝 Markdown Files")
-        for path, content in st.session_state["markdown_files"].items():
-            st.write(f"**{path}**")
-            with st.container():
-                st.code(content, language="markdown")
-
-# Separate expander for AI Summary
-with st.expander("🤖 AI Summary Preview", expanded=False):
-    if st.session_state["summary_error"]:
-        st.error(st.session_state["summary_error"])
-    elif st.session_state["summaries"]:
-        for path, summary in st.session_state["summaries"].items():
-            st.write(f"**📋 {path}**")
-            st.markdown(summary)
-            st.divider()  # Add a visual separator
-
-with st.expander("📄 HTML Document Preview", expanded=False):
-    if st.session_state["html_error"]:
-        st.error(st.session_state["html_error"])
-    elif st.session_state["html_content"]:
-        st.success("✅ HTML document generated successfully!")
-        
-        # Show HTML preview in an iframe
-        components.html(
-            st.session_state["html_content"],
-            height=600,
-            scrolling=True
-        )
+# ---------------- OUTPUT SECTIONS ----------------
+# Each section is a fragment so it can rerun on its own instead of replaying the whole script
+
+# Characters of a markdown file shown in the preview
+PREVIEW_CHARS = 2000
+
+@st.fragment
+def render_docs_expander():
+    """Main documentation expander"""
+    with st.expander("📄 Fetched Documentation", expanded=False):
+        if st.session_state["fetch_error"]:
+            st.error(st.session_state["fetch_error"])
+        elif st.session_state["markdown_files"]:
+            num_files = len(st.session_state["markdown_files"])
+            num_images = len(st.session_state.get("image_files", []))  # Fixed this line
+            
+            st.info(f"📊 Found {num_files} markdown files and {num_images} images")
+            
+            # Show images if any
+            if num_images > 0:
+                st.subheader("🖼️ Images Found")
+                for img_path in st.session_state["image_files"]:
+                    st.text(img_path)
+            
+            # Show markdown content only for the files the user opens,
+            # so the whole repo isn't sent to the browser on every rerun
+            st.subheader("📝 Markdown Files")
+            for path, content in st.session_state["markdown_files"].items():
+                if st.toggle(f"**{path}**", key=f"show_md::{path}"):
+                    preview = content[:PREVIEW_CHARS] + ("…" if len(content) > PREVIEW_CHARS else "")
+                    st.code(preview, language="markdown")
+
+
+@st.fragment
+def render_summary_expander():
+    """Separate expander for AI Summary"""
+    with st.expander("🤖 AI Summary Preview", expanded=False):
+        if st.session_state["summary_error"]:
+            st.error(st.session_state["summary_error"])
+        elif st.session_state["summaries"]:
+            for path, summary in st.session_state["summaries"].items():
+                st.write(f"**📋 {path}**")
+                st.markdown(summary)
+                st.divider()  # Add a visual separator
+
+
+@st.fragment
+def render_html_preview():
+    """HTML document preview expander"""
+    with st.expander("📄 HTML Document Preview", expanded=False):
+        if st.session_state["html_error"]:
+            st.error(st.session_state["html_error"])
+        elif st.session_state["html_content"]:
+            st.success("✅ HTML document generated successfully!")
+            
+            # Show HTML preview in an iframe
+            components.html(
+                st.session_state["html_content"],
+                height=600,
+                scrolling=True
+            )
+
 
+render_docs_expander()
+render_summary_expander()
+render_html_preview()
@@ -1,55 +1,99 @@
 import os
+import re
+from collections import defaultdict
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, Iterator, List
+from jinja2 import Environment, FileSystemLoader
+from markupsafe import Markup, escape
+
+# Templates are compiled once at import and reused for every document.
+# Autoescape keeps file names and summaries from the repo from injecting HTML.
+_ENV = Environment(
+    loader=FileSystemLoader(os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")),
+    autoescape=True,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    keep_trailing_newline=True
+)
+_TEMPLATE = _ENV.get_template("onboarding.html.j2")
+_SECTION_TEMPLATE = _ENV.get_template("section.html.j2")
+_GALLERY_TEMPLATE = _ENV.get_template("gallery.html.j2")
+
+# Classifies a summary paragraph in one match: a note, or the reference line
+# with its optional markdown link [filename](path); anything else is plain text
+_PARA_RE = re.compile(
+    r'(?P<note>Note:)'
+    r'|(?P<ref>.*?For full details, refer to:(?:.*?\[(?P<name>[^\]]+)\]\((?P<path>[^)]+)\))?)',
+    re.DOTALL
+)
+
+# Section titles: spaced-out path separators, underscores and dashes as spaces
+_DISPLAY_TRANS = str.maketrans({"/": " / ", "_": " ", "-": " "})
+
+# Gallery categories by keywords in the image path
+_ARCH_RE = re.compile(r'architecture|diagram|flow|design', re.IGNORECASE)
+_SCREEN_RE = re.compile(r'screenshot|screen|demo', re.IGNORECASE)
+
+# TOC categories for large repos, in display order; files are matched by
+# file name, then directory keywords
+_CATEGORY_ORDER = (
+    "README and Main Docs",
+    "Documentation",
+    "Guides and Tutorials",
+    "API Reference",
+    "Other Files"
+)
+_README_NAMES = frozenset({"readme.md", "index.md"})
+_DOC_KW = ("doc", "guide")
+_TUT_KW = ("tutorial", "example")
+_API_KW = ("api", "reference")
 
 def organize_content_for_html(markdown_files, summaries):
     """
-    Organize content into logical groups to avoid overwhelming TOC
+    Organize content into logical groups to avoid overwhelming TOC.
+    Only categories that received files are returned, in _CATEGORY_ORDER.
     """
-    organized = {
-        "README and Main Docs": {},
-        "Documentation": {},
-        "Guides and Tutorials": {},
-        "API Reference": {},
-        "Other Files": {}
-    }
+    organized = defaultdict(dict)
     
-    for path in markdown_files.keys():
-        file_name = os.path.basename(path).lower()
-        dir_name = os.path.dirname(path).lower()
+    for path in markdown_files:
+        dir_part, _, file_part = path.rpartition("/")
+        dir_name = dir_part.lower()
         
         # Categorize files
-        if file_name in ["readme.md", "index.md"]:
-            organized["README and Main Docs"][path] = summaries.get(path, "")
-        elif "doc" in dir_name or "guide" in dir_name:
-            organized["Documentation"][path] = summaries.get(path, "")
-        elif "tutorial" in dir_name or "example" in dir_name:
-            organized["Guides and Tutorials"][path] = summaries.get(path, "")
-        elif "api" in dir_name or "reference" in dir_name:
-            organized["API Reference"][path] = summaries.get(path, "")
+        if file_part.lower() in _README_NAMES:
+            category = "README and Main Docs"
+        elif any(keyword in dir_name for keyword in _DOC_KW):
+            category = "Documentation"
+        elif any(keyword in dir_name for keyword in _TUT_KW):
+            category = "Guides and Tutorials"
+        elif any(keyword in dir_name for keyword in _API_KW):
+            category = "API Reference"
         else:
-            organized["Other Files"][path] = summaries.get(path, "")
+            category = "Other Files"
+        organized[category][path] = summaries.get(path, "")
     
-    return organized
+    return {category: organized[category] for category in _CATEGORY_ORDER if category in organized}
+
+
+def build_section(file_path, summary, section_id, owner, repo_name, branch="main"):
+    """
+    Collect the template fields for a single file section
+    """
+    return {
+        "id": section_id,
+        "name": os.path.basename(file_path),
+        "display_name": file_path.translate(_DISPLAY_TRANS),
+        "path": file_path,
+        # Create clickable link for the markdown file
+        "url": f"https://github.com/{owner}/{repo_name}/blob/{branch}/{file_path}",
+        "body": format_summary_content(summary, owner, repo_name, branch)
+    }
 
-def create_file_section(file_path, summary, section_id, image_files, owner, repo_name):
+def create_file_section(file_path, summary, section_id, image_files, owner, repo_name, branch="main"):
     """
     Create a section for a single file (without inline images)
     """
-    display_name = file_path.replace("/", " / ").replace("_", " ").replace("-", " ")
-    
-    # Create clickable link for the markdown file
-    file_url = f"https://github.com/{owner}/{repo_name}/blob/main/{file_path}"
-    
-    return f'''
-        <div class="section" id="{section_id}">
-            <h2 class="section-title">{display_name}</h2>
-            <div class="section-path">📁 <a href="{file_url}" target="_blank" class="file-link">{file_path}</a></div>
-            <div class="section-content">
-                {format_summary_content(summary, owner, repo_name)}
-            </div>
-        </div>
-    '''
+    return _SECTION_TEMPLATE.render(section=build_section(file_path, summary, section_id, owner, repo_name, branch))
 
 def generate_onboarding_html(
     summaries: Dict[str, str],
@@ -67,141 +111,93 @@ def generate_onboarding_html(
     - Section-by-section content
     - Professional CSS styling
     """
-    
+    return "".join(iter_onboarding_html(summaries, repo_meta, author, company, markdown_files, image_files))
+
+def iter_onboarding_html(
+    summaries: Dict[str, str],
+    repo_meta: Dict[str, str],
+    author: str = "Riddhi Shah",
+    company: str = "Bazel Inc",
+    markdown_files: Dict[str, str] = None,
+    image_files: List[str] = None
+) -> Iterator[str]:
+    """
+    Yield the onboarding document in fragments as the template renders,
+    so it can be written out without holding the whole string
+    """
+    context = _document_context(summaries, repo_meta, author, company, markdown_files, image_files)
+    return _iter_document(context)
+
+def _iter_document(context, as_bytes=False):
+    """
+    The one fragment sequence both writers use: static head, escaped title,
+    rest of the head, then the rendered body. With as_bytes the fragments are
+    UTF-8 bytes, the static head parts precomputed.
+    """
+    title = escape(context["repo_name"])
+    body = _TEMPLATE.generate(**context)
+    if as_bytes:
+        yield _HEAD_PREFIX_BYTES
+        yield title.encode("utf-8")
+        yield _HEAD_SUFFIX_BYTES
+        for fragment in body:
+            yield fragment.encode("utf-8")
+    else:
+        yield _HEAD_PREFIX
+        yield title
+        yield _HEAD_SUFFIX
+        yield from body
+
+def _document_context(summaries, repo_meta, author="Riddhi Shah", company="Bazel Inc",
+                      markdown_files=None, image_files=None):
+    """
+    Collect the template variables for the document body
+    """
     # Extract repo info
     repo_name = repo_meta.get("repo", "Repository")
     owner = repo_meta.get("owner", "Unknown")
-    github_url = f"https://github.com/{owner}/{repo_name}"
-    current_date = datetime.now().strftime("%B %d, %Y")
+    branch = repo_meta.get("branch", "main")
     
     # Organize content into categories to avoid overwhelming TOC
-    if markdown_files and len(summaries) > 20:  # Only organize if many files
+    # (and add category headers only then, even if every file lands in one)
+    show_categories = bool(markdown_files) and len(summaries) > 20  # Only organize if many files
+    if show_categories:
         organized_content = organize_content_for_html(markdown_files, summaries)
     else:
         # Keep simple structure for small repos
         organized_content = {"Documentation": summaries}
     
-    # Generate table of contents for organized sections
-    toc_items = []
-    section_content = []
+    # Number sections across categories
+    categories = []
     section_counter = 1
-    
     for category, files in organized_content.items():
-        if not files:  # Skip empty categories
-            continue
-        
-        # Add category header only if we have multiple categories
-        if len(organized_content) > 1:
-            toc_items.append(f'<li class="toc-category">{category} ({len(files)} files)</li>')
-        
-        # Create sections for each file in this category
-        for file_path, summary in files.items():
-            section_id = f"section-{section_counter}"
-            display_name = file_path.replace("/", " / ").replace("_", " ").replace("-", " ")
-            
-            toc_items.append(f'<li><a href="#{section_id}">{os.path.basename(file_path)}</a></li>')
-            
-            # Create section with images
-            section_content.append(create_file_section(
-                file_path, 
-                summary, 
-                section_id,
-                None,
-                owner,
-                repo_name
-            ))
-            section_counter += 1
-
-        # Create separate image gallery
-    image_gallery_section = create_image_gallery_section(image_files, owner, repo_name)
-    
-    # Build complete HTML
-    html_template = f'''
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{repo_name} - Onboarding Documentation</title>
-    <style>
-        {get_css_styles()}
-    </style>
-</head>
-<body>
-    <!-- Cover Page -->
-    <div class="cover-page">
-        <div class="cover-header">
-            <div class="company-branding">
-                <h1 class="company-name">{company}</h1>
-                <div class="company-tagline">Knowledge Base Documentation</div>
-            </div>
-        </div>
-        
-        <div class="cover-main">
-            <h1 class="project-title">{repo_name}</h1>
-            <h2 class="subtitle">Onboarding Documentation</h2>
-            
-            <div class="project-info">
-                <div class="info-item">
-                    <span class="label">Repository:</span>
-                    <a href="{github_url}" target="_blank" class="repo-link">{github_url}</a>
-                </div>
-                <div class="info-item">
-                    <span class="label">Author:</span>
-                    <span class="value">{author}</span>
-                </div>
-                <div class="info-item">
-                    <span class="label">Generated:</span>
-                    <span class="value">{current_date}</span>
-                </div>
-                <div class="info-item">
-                    <span class="label">Branch:</span>
-                    <span class="value">{repo_meta.get("branch", "main")}</span>
-                </div>
-            </div>
-        </div>
-        
-        <div class="cover-footer">
-            <p>This document provides an overview of the repository structure and key documentation files.</p>
-        </div>
-    </div>
-
-    <!-- Table of Contents Page -->
-    <div class="toc-page">
-        <h1 class="page-title">Table of Contents</h1>
-        <div class="toc-summary">
-            <p>This document contains <strong>{len(summaries)}</strong> sections covering the main documentation files in the repository.</p>
-        </div>
-        <ul class="toc-list">
-            {"".join(toc_items)}
-        </ul>
-    </div>
-
-    <!-- Content Sections -->
-    <div class="content-pages">
-        {"".join(section_content)}
-    </div>
-
-    <!-- Image Gallery Section -->
-    {image_gallery_section}
-
-    <!-- Footer -->
-    <div class="document-footer">
-        <p>Generated by AI-Powered Onboarding Documentation System</p>
-        <p>For the most up-to-date information, please refer to the repository at <a href="{github_url}">{github_url}</a></p>
-    </div>
-</body>
-</html>
-'''
+        sections = [
+            build_section(file_path, summary, f"section-{number}", owner, repo_name, branch)
+            for number, (file_path, summary) in enumerate(files.items(), start=section_counter)
+        ]
+        section_counter += len(sections)
+        categories.append((category, sections))
     
-    return html_template
-
-def create_image_gallery_section(image_files, owner, repo_name):
+    return dict(
+        repo_name=repo_name,
+        company=company,
+        author=author,
+        github_url=f"https://github.com/{owner}/{repo_name}",
+        current_date=datetime.now().strftime("%B %d, %Y"),
+        branch=branch,
+        section_count=len(summaries),
+        show_categories=show_categories,
+        categories=categories,
+        image_groups=categorize_images(image_files, owner, repo_name, branch)
+    )
+
+def categorize_images(image_files, owner, repo_name, branch="main"):
     """
-    Create a dedicated section for all images/diagrams
+    Split images into gallery groups: a list of (title, images) where each
+    image is a (url, name, path) tuple; empty groups are left out
     """
     if not image_files:
-        return ""
+        return []
     
     # Categorize images
     architecture_images = []
@@ -209,110 +205,63 @@ def create_image_gallery_section(image_files, owner, repo_name):
     other_images = []
     
     for img_path in image_files:
-        img_lower = img_path.lower()
-        if any(keyword in img_lower for keyword in ['architecture', 'diagram', 'flow', 'design']):
+        if _ARCH_RE.search(img_path):
             architecture_images.append(img_path)
-        elif any(keyword in img_lower for keyword in ['screenshot', 'screen', 'demo']):
+        elif _SCREEN_RE.search(img_path):
             screenshot_images.append(img_path)
         else:
             other_images.append(img_path)
     
-    gallery_html = '''
-    <div class="image-gallery-section">
-        <h1 class="gallery-title">🎨 Visual Assets & Architecture</h1>
-        <div class="gallery-intro">
-            <p>This section contains all visual assets found in the repository, organized by type.</p>
-        </div>
-    '''
-    
-    # Architecture diagrams
-    if architecture_images:
-        gallery_html += '<h2 class="gallery-category">🏗️ Architecture & Diagrams</h2><div class="image-grid">'
-        for img_path in architecture_images:
-            img_url = f"https://raw.githubusercontent.com/{owner}/{repo_name}/main/{img_path}"
-            img_name = os.path.basename(img_path)
-            gallery_html += f'''
-                <div class="gallery-item">
-                    <img src="{img_url}" alt="{img_name}" class="gallery-image" />
-                    <div class="gallery-caption">
-                        <strong>{img_name}</strong><br>
-                        <small>📁 {img_path}</small>
-                    </div>
-                </div>
-            '''
-        gallery_html += '</div>'
-    
-    # Screenshots
-    if screenshot_images:
-        gallery_html += '<h2 class="gallery-category">📷 Screenshots & Demos</h2><div class="image-grid">'
-        for img_path in screenshot_images:
-            img_url = f"https://raw.githubusercontent.com/{owner}/{repo_name}/main/{img_path}"
-            img_name = os.path.basename(img_path)
-            gallery_html += f'''
-                <div class="gallery-item">
-                    <img src="{img_url}" alt="{img_name}" class="gallery-image" />
-                    <div class="gallery-caption">
-                        <strong>{img_name}</strong><br>
-                        <small>📁 {img_path}</small>
-                    </div>
-                </div>
-            '''
-        gallery_html += '</div>'
-    
-    # Other images
-    if other_images:
-        gallery_html += '<h2 class="gallery-category">🖼️ Other Images</h2><div class="image-grid">'
-        for img_path in other_images:
-            img_url = f"https://raw.githubusercontent.com/{owner}/{repo_name}/main/{img_path}"
-            img_name = os.path.basename(img_path)
-            gallery_html += f'''
-                <div class="gallery-item">
-                    <img src="{img_url}" alt="{img_name}" class="gallery-image" />
-                    <div class="gallery-caption">
-                        <strong>{img_name}</strong><br>
-                        <small>📁 {img_path}</small>
-                    </div>
-                </div>
-            '''
-        gallery_html += '</div>'
-    
-    gallery_html += '</div>'
-    return gallery_html
+    groups = [
+        ("🏗️ Architecture & Diagrams", architecture_images),
+        ("📷 Screenshots & Demos", screenshot_images),
+        ("🖼️ Other Images", other_images)
+    ]
+    img_prefix = f"https://raw.githubusercontent.com/{owner}/{repo_name}/{branch}/"
+    return [
+        (title, [(img_prefix + img_path, os.path.basename(img_path), img_path) for img_path in images])
+        for title, images in groups
+        if images
+    ]
+
+def create_image_gallery_section(image_files, owner, repo_name, branch="main"):
+    """
+    Create a dedicated section for all images/diagrams
+    """
+    return _GALLERY_TEMPLATE.render(image_groups=categorize_images(image_files, owner, repo_name, branch))
 
-def format_summary_content(summary: str, owner: str = None, repo_name: str = None) -> str:
+def format_summary_content(summary: str, owner: str = None, repo_name: str = None, branch: str = "main") -> Markup:
     """Format summary content with proper HTML markup and correct GitHub links"""
     # Split into paragraphs
     paragraphs = summary.split('\n\n')
     formatted_paragraphs = []
+    fix_links = bool(owner and repo_name)
     
     for para in paragraphs:
         para = para.strip()
         if not para:
             continue
             
-        # Check for special formatting
-        if para.startswith("Note:"):
-            formatted_paragraphs.append(f'<div class="note">{para}</div>')
-        elif "For full details, refer to:" in para and owner and repo_name:
+        # Check for special formatting (summary text is escaped, it comes from the model)
+        match = _PARA_RE.match(para)
+        if match and match.group("note"):
+            formatted_paragraphs.append(Markup('<div class="note">{}</div>').format(para))
+        elif match and fix_links:
             # Fix the GitHub link in the summary
-            import re
-            # Look for markdown link format [filename](path)
-            link_match = re.search(r'\[([^\]]+)\]\(([^)]+)\)', para)
-            if link_match:
-                file_name = link_match.group(1)
-                file_path = link_match.group(2)
-                github_url = f"https://github.com/{owner}/{repo_name}/blob/main/{file_path}"
-                para = f'For full details, refer to: <a href="{github_url}" target="_blank" class="file-link">{file_name}</a>'
-            formatted_paragraphs.append(f'<div class="reference">{para}</div>')
+            if match.group("path"):
+                file_name = match.group("name")
+                file_path = match.group("path")
+                github_url = f"https://github.com/{owner}/{repo_name}/blob/{branch}/{file_path}"
+                para = Markup('For full details, refer to: <a href="{}" target="_blank" class="file-link">{}</a>').format(github_url, file_name)
+            formatted_paragraphs.append(Markup('<div class="reference">{}</div>').format(para))
         else:
-            formatted_paragraphs.append(f'<p>{para}</p>')
+            formatted_paragraphs.append(Markup('<p>{}</p>').format(para))
     
-    return "".join(formatted_paragraphs)
+    return Markup("").join(formatted_paragraphs)
 
 
-def get_css_styles() -> str:
-    """Return comprehensive CSS styles for the onboarding document"""
-    return '''
+# Comprehensive CSS styles for the onboarding document, built once at import
+_CSS_STYLES = '''
         * {
             margin: 0;
             padding: 0;
@@ -637,6 +586,43 @@ def get_css_styles() -> str:
     '''
 
 
+# Static document head around the escaped repo name in <title>; the body
+# comes from the template. Kept as bytes too for the streaming file writer.
+_HEAD_PREFIX = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>"""
+_HEAD_SUFFIX = """ - Onboarding Documentation</title>
+    <style>
+        """ + _CSS_STYLES + """
+    </style>
+</head>
+"""
+_HEAD_PREFIX_BYTES = _HEAD_PREFIX.encode("utf-8")
+_HEAD_SUFFIX_BYTES = _HEAD_SUFFIX.encode("utf-8")
+
+def get_css_styles() -> str:
+    """Return comprehensive CSS styles for the onboarding document"""
+    return _CSS_STYLES
+
+
+def stream_onboarding_html_to_file(
+    summaries: Dict[str, str],
+    repo_meta: Dict[str, str],
+    filename: str = "onboarding_document.html",
+    **kwargs
+) -> str:
+    """Render the onboarding document straight to a file and return the file path"""
+    filepath = os.path.abspath(filename)
+    context = _document_context(summaries, repo_meta, **kwargs)
+    
+    with open(filepath, 'wb', buffering=1 << 20) as f:
+        f.writelines(_iter_document(context, as_bytes=True))
+    
+    return filepath
+
 def save_html_file(html_content: str, filename: str = "onboarding_document.html") -> str:
     """Save HTML content to file and return the file path"""
     filepath = os.path.abspath(filename)
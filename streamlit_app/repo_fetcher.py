@@ -1,10 +1,34 @@
+import asyncio
+import logging
+import os
+import posixpath
+import tarfile
+import diskcache
+import httpx
 import requests
+from functools import lru_cache
 from urllib.parse import urlparse
 
+log = logging.getLogger(__name__)
+
 GITHUB_API_BASE = "https://api.github.com"
 RAW_BASE = "https://raw.githubusercontent.com"
 
 SUPPORTED_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".svg")
+_IMAGE_EXT_SET = frozenset(SUPPORTED_IMAGE_EXTENSIONS)
+
+# Markdown files larger than this (e.g. generated docs) are skipped
+MAX_MARKDOWN_BYTES = 1_000_000
+
+# Concurrent raw downloads (kept-alive connections) for the per-file fallback
+MAX_DOWNLOAD_CONNECTIONS = 32
+
+# Fetched docs keyed by commit SHA, so a cached entry can never be stale
+FETCH_CACHE_DIR = os.getenv("FETCH_CACHE_DIR", os.path.join(".cache", "repos"))
+
+# One session so the sequential GitHub API calls (repo, commit, tarball, tree)
+# reuse a kept-alive connection; requests' default pool size is plenty for that
+_SESSION = requests.Session()
 
 
 def parse_repo_url(repo_url: str):
@@ -19,7 +43,7 @@ def parse_repo_url(repo_url: str):
 def get_repo_default_branch(owner: str, repo: str):
     """Fetch default branch for the repo (main/master)."""
     url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}"
-    resp = requests.get(url)
+    resp = _SESSION.get(url)
     resp.raise_for_status()
     return resp.json().get("default_branch", "main")
 
@@ -27,61 +51,223 @@ def get_repo_default_branch(owner: str, repo: str):
 def get_repo_tree(owner: str, repo: str, branch: str):
     """Fetch full recursive file tree for the repo."""
     url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/git/trees/{branch}?recursive=1"
-    resp = requests.get(url)
+    resp = _SESSION.get(url)
     resp.raise_for_status()
     return resp.json().get("tree", [])
 
 
-def download_raw_file(owner: str, repo: str, branch: str, path: str):
-    """Download raw file content from GitHub."""
+def get_branch_sha(owner: str, repo: str, branch: str):
+    """Resolve the branch tip to its commit SHA (None if it cannot be resolved, e.g. empty repo)."""
+    url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/commits/{branch}"
+    # The sha media type returns just the SHA instead of the full commit JSON
+    resp = _SESSION.get(url, headers={"Accept": "application/vnd.github.sha"})
+    if resp.status_code != 200:
+        return None
+    return resp.text.strip()
+
+
+async def download_raw_file_async(client: httpx.AsyncClient, owner: str, repo: str, branch: str, path: str):
+    """Download raw file content from GitHub without blocking the event loop (None on failure)."""
     raw_url = f"{RAW_BASE}/{owner}/{repo}/{branch}/{path}"
-    resp = requests.get(raw_url)
+    try:
+        resp = await client.get(raw_url)
+    except httpx.HTTPError as e:
+        # One failed download must not abort the others gathered with it
+        log.warning("⚠️ Download failed for %s: %s", path, e)
+        return None
     if resp.status_code == 200:
-        return resp.text
+        # Decode as UTF-8 directly instead of guessing the charset
+        return resp.content.decode("utf-8", errors="replace")
     return None
 
 
-def fetch_repository_docs(repo_url: str):
-    """Main function to fetch ALL markdown files and ALL images."""
-    print(f"🔍 Fetching from: {repo_url}")
+async def download_raw_files_async(owner: str, repo: str, branch: str, paths):
+    """
+    Download many raw files concurrently over one async client.
+    Returns (path, content) pairs in the order of paths.
+    """
+    limits = httpx.Limits(max_connections=MAX_DOWNLOAD_CONNECTIONS)
+    # Follow redirects like requests does, or any 3xx would count as a failure
+    async with httpx.AsyncClient(timeout=30.0, limits=limits, follow_redirects=True) as client:
+        contents = await asyncio.gather(
+            *(download_raw_file_async(client, owner, repo, branch, path) for path in paths)
+        )
+    return list(zip(paths, contents))
+
+
+def file_extension(path: str):
+    """Lowercased extension including the dot ("" if none), without lowercasing the whole path."""
+    _, dot, ext = path.rpartition(".")
+    # A dot in a directory name (e.g. "docs.v2/Makefile") is not an extension
+    if not dot or "/" in ext:
+        return ""
+    return "." + ext.lower()
+
+
+def safe_archive_path(name: str):
+    """
+    Strip the archive's top-level "<owner>-<repo>-<sha>/" folder from a member name.
+    Returns None for directories and for names escaping the repo root (path traversal).
+    """
+    _, _, path = name.partition("/")
+    if not path or path.endswith("/"):
+        return None
+    normalized = posixpath.normpath(path)
+    if normalized.startswith("/") or normalized == ".." or normalized.startswith("../"):
+        return None
+    return normalized
+
+
+def fetch_from_archive(owner: str, repo: str, branch: str):
+    """
+    Stream the branch as one gzipped tarball and collect markdown files and images
+    from it in memory. Returns None when the tarball is unavailable (e.g. empty repo).
+    """
+    tarball_url = f"{GITHUB_API_BASE}/repos/{owner}/{repo}/tarball/{branch}"
+    with _SESSION.get(tarball_url, stream=True) as resp:
+        if resp.status_code != 200:
+            log.warning("⚠️ Tarball unavailable (%s), falling back to per-file download", resp.status_code)
+            return None
+
+        markdown_files = {}
+        image_files = []
+
+        # "r|gz" reads the members sequentially straight off the socket
+        with tarfile.open(fileobj=resp.raw, mode="r|gz") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                original_path = safe_archive_path(member.name)
+                if original_path is None:
+                    continue
+
+                ext = file_extension(original_path)
+
+                # Collect markdown files
+                if ext == ".md":
+                    if member.size > MAX_MARKDOWN_BYTES:
+                        log.info("⚠️ Skipping large markdown: %s (%d bytes)", original_path, member.size)
+                        continue
+                    content = tar.extractfile(member).read().decode("utf-8", errors="replace")
+                    if content:
+                        markdown_files[original_path] = content
+
+                # Collect images (full paths only)
+                elif ext in _IMAGE_EXT_SET:
+                    image_files.append(original_path)
+
+    return markdown_files, image_files
+
+
+def fetch_repository_docs(repo_url: str, refresh: bool = False):
+    """
+    Main function to fetch ALL markdown files and ALL images.
+    refresh=True ignores and replaces the cached fetch for the current commit.
+    """
+    log.info("🔍 Fetching from: %s", repo_url)
     
     owner, repo = parse_repo_url(repo_url)
-    print(f"📂 Owner: {owner}, Repo: {repo}")
+    log.info("📂 Owner: %s, Repo: %s", owner, repo)
     
     branch = get_repo_default_branch(owner, repo)
-    print(f"🌿 Branch: {branch}")
+    log.info("🌿 Branch: %s", branch)
+
+    sha = get_branch_sha(owner, repo, branch)
+    if sha is None:
+        return download_docs(owner, repo, branch, branch)[0]
+    log.info("📌 Commit: %s", sha)
+    return _fetch_at_sha(owner, repo, branch, sha, refresh)
+
 
-    tree = get_repo_tree(owner, repo, branch)
-    print(f"🌳 Tree items found: {len(tree)}")
+@lru_cache(maxsize=None)
+def _get_fetch_cache():
+    """On-disk fetch cache, opened on first use"""
+    return diskcache.Cache(FETCH_CACHE_DIR)
+
+
+def _fetch_at_sha(owner: str, repo: str, branch: str, sha: str, refresh: bool = False):
+    """
+    Docs at one commit, from disk, else GitHub. Only complete fetches are
+    cached, so a partial download is retried next time instead of kept.
+    """
+    cache = _get_fetch_cache()
+    key = f"{owner}/{repo}@{sha}"
+    if refresh:
+        cache.delete(key)
+    else:
+        result = cache.get(key)
+        if result is not None:
+            log.info("💾 Using cached fetch for %s", key)
+            return result
+
+    result, complete = download_docs(owner, repo, branch, sha)
+    if complete:
+        cache.set(key, result)
+    return result
+
+
+def download_docs(owner: str, repo: str, branch: str, ref: str):
+    """
+    Download markdown files and list images at ref (a branch name or commit SHA).
+    Returns (result, complete); complete is False if any markdown download failed.
+    """
+    # One tarball request instead of one request per file
+    archive = fetch_from_archive(owner, repo, ref)
+    if archive is not None:
+        markdown_files, image_files = archive
+        log.info("📦 Tarball - Markdown: %d, Images: %d", len(markdown_files), len(image_files))
+        return {
+            "markdown_files": markdown_files,
+            "image_files": image_files,
+            "branch": branch,
+            "repo": repo,
+            "owner": owner
+        }, True
+
+    tree = get_repo_tree(owner, repo, ref)
+    log.info("🌳 Tree items found: %d", len(tree))
 
     markdown_files = {}
     image_files = []
+    md_paths = []
 
     for item in tree:
         if item["type"] != "blob":
             continue
 
-        path = item["path"].lower()
-        original_path = item["path"]  # Keep original case for return
+        original_path = item["path"]
+        ext = file_extension(original_path)
 
-        # Debug: Print all files found
-        print(f"📄 Found file: {original_path}")
+        log.debug("📄 Found file: %s", original_path)
 
-        # Collect markdown files
-        if path.endswith(".md"):
-            print(f"📝 Processing markdown: {original_path}")
-            content = download_raw_file(owner, repo, branch, original_path)
-            if content:
-                markdown_files[original_path] = content
-                print(f"✅ Downloaded markdown: {original_path}")
+        # Collect markdown files (downloaded together below)
+        if ext == ".md":
+            size = item.get("size", 0)
+            if size > MAX_MARKDOWN_BYTES:
+                log.info("⚠️ Skipping large markdown: %s (%d bytes)", original_path, size)
+                continue
+            log.debug("📝 Processing markdown: %s", original_path)
+            md_paths.append(original_path)
 
         # Collect images (full paths only)
-        if path.endswith(SUPPORTED_IMAGE_EXTENSIONS):
-            print(f"🖼️ Found image: {original_path}")
+        elif ext in _IMAGE_EXT_SET:
+            log.debug("🖼️ Found image: %s", original_path)
             image_files.append(original_path)
 
-    print(f"📊 Final count - Markdown: {len(markdown_files)}, Images: {len(image_files)}")
-    print(f"🖼️ Image files found: {image_files}")
+    # Download markdown concurrently; results keep the tree order
+    results = asyncio.run(download_raw_files_async(owner, repo, ref, md_paths))
+    failed_paths = []
+    for original_path, content in results:
+        if content is None:
+            failed_paths.append(original_path)
+        elif content:
+            markdown_files[original_path] = content
+            log.debug("✅ Downloaded markdown: %s", original_path)
+    if failed_paths:
+        log.warning("⚠️ Could not download %d markdown files: %s", len(failed_paths), failed_paths)
+
+    log.info("📊 Final count - Markdown: %d, Images: %d", len(markdown_files), len(image_files))
+    log.debug("🖼️ Image files found: %s", image_files)
 
     return {
         "markdown_files": markdown_files,   # dict: path → content
@@ -89,4 +275,4 @@ def fetch_repository_docs(repo_url: str):
         "branch": branch,
         "repo": repo,
         "owner": owner
-    }
\ No newline at end of file
+    }, not failed_paths
\ No newline at end of file